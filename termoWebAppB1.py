@@ -1,21 +1,17 @@
 import streamlit as st
-import json
-import re
 import os
 import io
+import hashlib
 import math
-import matplotlib.pyplot as plt
-import geopandas as gpd
-import pandas as pd
+import logging
 import numpy as np
-from shapely.geometry import Point
-import contextily as cx
-from matplotlib.ticker import FuncFormatter
+import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image, ImageDraw, ImageOps
 from datetime import datetime
-from docxtpl import DocxTemplate, InlineImage
-from docx.shared import Cm
-from staticmap import StaticMap, CircleMarker
-from typing import List, Union
+from types import SimpleNamespace
 
 def obtener_template_path(cantidadObjetos: int) -> str:
     """
@@ -29,6 +25,105 @@ def obtener_template_path(cantidadObjetos: int) -> str:
     nombre_template = f"templateTermoN{cantidadObjetos}.docx"
     return os.path.join('templates', nombre_template)
 
+@st.cache_resource(show_spinner=False)
+def _lazy_import_docx():
+    """
+    Importa docxtpl y python-docx solo cuando se necesitan (Paso 2), no al arrancar la app.
+    Va en st.cache_resource (no lru_cache, que se pierde en cada rerun) para que
+    PlantillaDocx e ImagenInline se definan una sola vez por proceso: la plantilla
+    guardada en st.session_state.doc sigue siendo de la misma clase entre reruns.
+    Retorna un namespace con DocxTemplate, InlineImage, Cm, PlantillaDocx, ImagenInline
+    y los tamaños fijos de las imágenes ya convertidos a EMU.
+    """
+    from docxtpl import DocxTemplate, InlineImage
+    from docx.shared import Cm
+
+    class PlantillaDocx(DocxTemplate):
+        """
+        DocxTemplate que reutiliza el XML del cuerpo ya parcheado (get_xml + patch_xml).
+        En cada render solo se ejecutan render_xml_part y map_tree.
+        """
+
+        def __init__(self, template_file, patched_xml=None):
+            super().__init__(template_file)
+            self._patched_xml = patched_xml
+            self._fragmentos_img = {}
+
+        def render_init(self):
+            super().render_init()
+            # Cada render recarga el documento: los rId de renders anteriores ya no son válidos
+            self._fragmentos_img = {}
+
+        def build_xml(self, context, jinja_env=None):
+            if self._patched_xml is None:
+                self._patched_xml = self.patch_xml(self.get_xml())
+            return self.render_xml_part(self._patched_xml, self.docx._part, context, jinja_env)
+
+    class ImagenInline(InlineImage):
+        """
+        InlineImage que, dentro de un mismo render, reutiliza el XML <w:drawing> (y su rId)
+        ya generado para una imagen con la misma huella de contenido y tamaño.
+        """
+
+        def __init__(self, tpl, image_descriptor, width=None, height=None, anchor=None, huella=None):
+            super().__init__(tpl, image_descriptor, width, height, anchor)
+            self.huella = huella
+
+        def _insert_image(self):
+            if self.huella is None:
+                return super()._insert_image()
+            clave = (id(self.tpl.current_rendering_part), self.huella, self.width, self.height, self.anchor)
+            fragmentos = self.tpl._fragmentos_img
+            if clave not in fragmentos:
+                fragmentos[clave] = super()._insert_image()
+            return fragmentos[clave]
+
+    return SimpleNamespace(
+        DocxTemplate=DocxTemplate,
+        InlineImage=InlineImage,
+        Cm=Cm,
+        PlantillaDocx=PlantillaDocx,
+        ImagenInline=ImagenInline,
+        ANCHO_IMG=Cm(7.5),
+        ALTO_IMG=Cm(6.5),
+        ANCHO_MAPA=Cm(15),
+        ALTO_MAPA=Cm(10),
+    )
+
+@st.cache_resource(show_spinner=False)
+def obtener_xml_parcheado(template_path: str, mtime: float) -> str:
+    """
+    Parsea y parchea el cuerpo de la plantilla una sola vez por archivo.
+    mtime forma parte de la clave: si la plantilla se modifica en disco se vuelve a parsear.
+    """
+    plantilla = _lazy_import_docx().DocxTemplate(template_path)
+    plantilla.init_docx()
+    return plantilla.patch_xml(plantilla.get_xml())
+
+@st.cache_resource(show_spinner=False)
+def obtener_variables_template(template_path: str, mtime: float) -> frozenset:
+    """
+    Variables que la plantilla referencia (cuerpo, encabezados y pies), calculadas una vez por archivo.
+    """
+    plantilla = _lazy_import_docx().DocxTemplate(template_path)
+    return frozenset(plantilla.get_undeclared_template_variables())
+
+def get_cached_template(template_path: str):
+    """
+    Retorna una plantilla nueva para la sesión que comparte el XML parcheado en caché.
+    """
+    mtime = os.path.getmtime(template_path)  # FileNotFoundError si la plantilla no existe
+    return _lazy_import_docx().PlantillaDocx(template_path, obtener_xml_parcheado(template_path, mtime))
+
+def _to_float(value) -> float:
+    """
+    Convierte value a float aceptando coma decimal.
+    Los números (lo que retorna st.number_input) no pasan por str.replace.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).replace(',', '.'))
+
 def safe_float_convert(key):
     value = st.session_state.data.get(key)
     if value is None:
@@ -37,82 +132,295 @@ def safe_float_convert(key):
         # en teoría no debería llegar aquí si falta un campo crítico.
         raise ValueError(f"Campo crítico vacío: {key}") 
                 
-    # Si el valor ya es un número (float o int), simplemente lo devuelve
-    if isinstance(value, (int, float)):
-        return float(value)
-            
-    # Si es una cadena, reemplaza la coma por punto y convierte a float
-    return float(str(value).replace(',', '.'))
+    # Números se devuelven directo; cadenas con coma decimal se convierten
+    return _to_float(value)
 
     
-def clasificar_delta(valor_Delta: float, prom_Temperatura: float) -> str:
+# Tabla de clasificación indexada por [rango del delta][rango de temperatura promedio]
+_POSIBLE = ("Posible deficiencia", "Se requiere más información")
+_PROBABLE = ("Probable deficiencia", "Reparar en la próxima parada disponible")
+_DEFICIENCIA = ("Deficiencia", "Reparar tan pronto como sea posible")
+_MAYOR = ("Deficiencia mayor", "Reparar inmediatamente")
+_SIN_CLASIFICACION = ("Sin clasificación", "Verificar datos ingresados")
+
+TABLA_CLASIFICACION = (
+    #  T < 21              21 <= T <= 40       T > 40
+    (_SIN_CLASIFICACION, _SIN_CLASIFICACION, _SIN_CLASIFICACION),  # delta <= 0
+    (_POSIBLE,           _POSIBLE,           _POSIBLE),            # 0 < delta < 4
+    (_PROBABLE,          _PROBABLE,          _PROBABLE),           # 4 <= delta <= 15
+    (_SIN_CLASIFICACION, _DEFICIENCIA,       _MAYOR),              # delta > 15
+)
+
+# Fases en el orden en que se calculan los deltas: R-S, S-T, T-R
+FASES_DELTA = ('Rs', 'St', 'Tr')
+
+CLASIFICACIONES_TABLA = np.array([[c for c, _ in fila] for fila in TABLA_CLASIFICACION])
+ACCIONES_TABLA = np.array([[a for _, a in fila] for fila in TABLA_CLASIFICACION])
+
+def clasificar_deltas(deltas: np.ndarray, prom_Temperatura: np.ndarray):
     """
-    Clasifica el valor del delta según los rangos especificados.
-    Los primeros dos casos priorizan valor_Delta independientemente de la temperatura.
+    Clasifica los deltas de todos los objetos consultando TABLA_CLASIFICACION.
+    Los primeros dos rangos priorizan el delta independientemente de la temperatura.
+    - deltas: arreglo (fases, objetos) con los valores absolutos de los deltas.
+    - prom_Temperatura: arreglo (objetos,) con la temperatura promedio de cada objeto.
+    Retorna dos arreglos (clasificaciones, acciones) con la misma forma que deltas.
     """
-    # PRIORIDAD 1: Rangos basados solo en valor_Delta
-    if valor_Delta > 0 and valor_Delta < 4:
-        return ["Posible deficiencia", "Se requiere más información"]
-    
-    if valor_Delta >= 4 and valor_Delta <= 15:
-        return ["Probable deficiencia", "Reparar en la próxima parada disponible"]
-    
-    # PRIORIDAD 2: Rangos que consideran tanto valor_Delta como prom_Temperatura
-    if valor_Delta > 15 and prom_Temperatura >= 21 and prom_Temperatura <= 40:
-        return ["Deficiencia", "Reparar tan pronto como sea posible"]
-    
-    if valor_Delta > 15 and prom_Temperatura > 40:
-        return ["Deficiencia mayor", "Reparar inmediatamente"]
-    
-    # Caso por defecto (valores fuera de los rangos esperados)
-    return ["Sin clasificación", "Verificar datos ingresados"]
+    fila = np.select([deltas > 15, deltas >= 4, deltas > 0], [3, 2, 1], default=0)
+    columna = np.select([prom_Temperatura > 40, prom_Temperatura >= 21], [2, 1], default=0)
+    return CLASIFICACIONES_TABLA[fila, columna], ACCIONES_TABLA[fila, columna]
 
-def get_map_png_bytes(lon, lat, buffer_m=300, width_px=900, height_px=700, zoom=17):
+# Teselas satelitales (Esri World Imagery) en esquema XYZ de Web Mercator
+URL_TESELAS = "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
+TAM_TESELA = 256
+RADIO_TIERRA = 6378137.0
+
+@st.cache_resource(show_spinner=False)
+def obtener_sesion_teselas() -> requests.Session:
+    """
+    Sesión HTTP con reintentos para la descarga de teselas.
+    Streamlit vuelve a ejecutar el script en cada rerun, así que se crea con
+    st.cache_resource para conservar el pool de conexiones entre renders.
+    """
+    sesion = requests.Session()
+    sesion.mount("https://", HTTPAdapter(
+        pool_maxsize=8,
+        max_retries=Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504]),
+    ))
+    return sesion
+
+def descargar_tesela(x, y, zoom):
+    respuesta = obtener_sesion_teselas().get(URL_TESELAS.format(z=zoom, x=x, y=y), timeout=10)
+    respuesta.raise_for_status()
+    return Image.open(io.BytesIO(respuesta.content)).convert("RGB")
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_map_png_bytes(lon, lat, buffer_m=300, width_px=900, height_px=700, zoom=17, markersize=40):
     """
     Genera un PNG (bytes) de un mapa satelital con marcador en (lon, lat).
     - buffer_m: radio en metros alrededor del punto (controla "zoom").
     - zoom: nivel de teselas (18-19 suele ser bueno).
+    - markersize: área del marcador en pt² (misma convención que matplotlib a 100 dpi).
     """
-    # Crear punto y reproyectar a Web Mercator
-    gdf = gpd.GeoDataFrame(geometry=[Point(lon, lat)], crs="EPSG:4326").to_crs(epsg=3857)
-    pt = gdf.geometry.iloc[0]
-    
-    # Calcular bounding box
-    bbox = (pt.x - buffer_m, pt.y - buffer_m, pt.x + buffer_m, pt.y + buffer_m)
+    # Posición del punto en píxeles globales de Web Mercator para el nivel de zoom
+    tam_mundo = TAM_TESELA * 2 ** zoom
+    x_m = RADIO_TIERRA * math.radians(lon)
+    y_m = RADIO_TIERRA * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    px = (x_m / (2 * math.pi * RADIO_TIERRA) + 0.5) * tam_mundo
+    py = (0.5 - y_m / (2 * math.pi * RADIO_TIERRA)) * tam_mundo
+
+    # Calcular bounding box en píxeles (buffer_m en vertical, ancho según la proporción)
+    metros_por_px = 2 * math.pi * RADIO_TIERRA / tam_mundo
+    medio_alto = buffer_m / metros_por_px
+    medio_ancho = medio_alto * width_px / height_px
+    x0, y0 = px - medio_ancho, py - medio_alto
+    x1, y1 = px + medio_ancho, py + medio_alto
+
+    # Rango de teselas que cubre el bounding box
+    tx0, tx1 = int(x0 // TAM_TESELA), int(x1 // TAM_TESELA)
+    ty0, ty1 = int(y0 // TAM_TESELA), int(y1 // TAM_TESELA)
+    max_tesela = 2 ** zoom - 1
+    teselas = [(tx, ty) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)]
+
+    # Descargar las teselas en paralelo
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        imagenes = executor.map(
+            lambda t: descargar_tesela(t[0] % (max_tesela + 1), min(max(t[1], 0), max_tesela), zoom),
+            teselas,
+        )
+
+        # Unir las teselas en un mosaico
+        mosaico = Image.new("RGB", ((tx1 - tx0 + 1) * TAM_TESELA, (ty1 - ty0 + 1) * TAM_TESELA))
+        for (tx, ty), tesela in zip(teselas, imagenes):
+            mosaico.paste(tesela, ((tx - tx0) * TAM_TESELA, (ty - ty0) * TAM_TESELA))
+
+    # Recortar al bounding box y escalar al tamaño de salida
+    origen_x, origen_y = tx0 * TAM_TESELA, ty0 * TAM_TESELA
+    izq, arriba = round(x0 - origen_x), round(y0 - origen_y)
+    der, abajo = round(x1 - origen_x), round(y1 - origen_y)
+    img = mosaico.crop((izq, arriba, der, abajo)).resize((width_px, height_px), Image.LANCZOS)
+
+    # Dibujar marcador en la posición proyectada del punto dentro del recorte
+    cx = (px - origen_x - izq) * width_px / (der - izq)
+    cy = (py - origen_y - arriba) * height_px / (abajo - arriba)
+    r = math.sqrt(markersize) / 2 * 100 / 72
+    ImageDraw.Draw(img).ellipse((cx - r, cy - r, cx + r, cy + r), fill="red")
+
+    # Guardar a buffer en memoria
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
 
-    # Crear figura
-    fig, ax = plt.subplots(figsize=(width_px/100, height_px/100), dpi=100)
-    ax.set_xlim(bbox[0], bbox[2])
-    ax.set_ylim(bbox[1], bbox[3])
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_urban_map_png(lon, lat):
+    """
+    Genera un PNG (bytes) del mapa urbano (OpenStreetMap) con marcador en (lon, lat).
+    """
+    from staticmap import StaticMap, CircleMarker
 
-    # Añadir basemap (Esri World Imagery)
-    cx.add_basemap(ax, source=cx.providers.Esri.WorldImagery, crs="EPSG:3857", zoom=zoom)
+    mapa = StaticMap(600, 400)
+    mapa.add_marker(CircleMarker((lon, lat), 'red', 12))
+    img_map = mapa.render()
+    buf = io.BytesIO()
+    img_map.save(buf, format='PNG')
+    return buf.getvalue()
 
-    # Dibujar marcador
-    gdf.plot(ax=ax, markersize=40, color="red")
+# Lado máximo (px) de las fotos embebidas en el Word: 7.5 cm a 300 dpi son ~890 px
+LADO_MAX_IMG = 1200
 
-    ax.set_axis_off()
-    plt.tight_layout(pad=0)
+def reducir_imagen(upl):
+    """
+    Retorna un flujo con la imagen lista para InlineImage.
+    Si la imagen ya cabe en LADO_MAX_IMG se devuelve el archivo original (rebobinado);
+    si no, se reduce una sola vez y se guarda como JPEG calidad 85 (PNG si tiene transparencia).
+    """
+    upl.seek(0)
+    img = Image.open(upl)
+    if max(img.size) <= LADO_MAX_IMG:
+        upl.seek(0)
+        return upl
+
+    # Aplicar la orientación EXIF antes de reducir: al guardar se pierden los metadatos
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((LADO_MAX_IMG, LADO_MAX_IMG), Image.LANCZOS)
 
-    # Guardar a buffer en memoria
     buf = io.BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight", pad_inches=0)
-    plt.close(fig)
+    if img.mode in ("RGBA", "LA", "P"):
+        img.save(buf, "PNG", optimize=True)
+    else:
+        img.convert("RGB").save(buf, "JPEG", quality=85, optimize=True)
     buf.seek(0)
-    return buf.getvalue()
+    return buf
+
+def preparar_imagen(key_img: str, upl) -> tuple:
+    """
+    Huella blake2b del contenido y bytes listos para el Word de una imagen subida.
+    Se calculan una sola vez por archivo subido (file_id) y se guardan en la sesión
+    bajo la clave del widget, así solo se conserva la última imagen de cada campo.
+    """
+    file_id = getattr(upl, 'file_id', None)
+    preparadas = st.session_state.setdefault('imagenes_preparadas', {})
+    previa = preparadas.get(key_img)
+    if file_id is not None and previa is not None and previa[0] == file_id:
+        return previa[1], previa[2]
+
+    with upl.getbuffer() as contenido:
+        huella = hashlib.blake2b(contenido, digest_size=16).hexdigest()
+    datos_img = reducir_imagen(upl).getvalue()
+    if file_id is not None:
+        preparadas[key_img] = (file_id, huella, datos_img)
+    return huella, datos_img
+
+# Espera máxima (s) por el mapa al generar el Word; en enlaces lentos puede tardar
+ESPERA_MAX_MAPA = 60
+
+class _SinAvisoContextoPrefetch(logging.Filter):
+    """
+    Las funciones st.cache_data llamadas desde los hilos de prefetch registran
+    "missing ScriptRunContext!"; es esperado (no usan elementos de la UI), así que
+    se descarta solo para esos hilos.
+    """
+
+    def filter(self, record):
+        return not record.threadName.startswith("prefetch_mapa")
+
+@st.cache_resource(show_spinner=False)
+def obtener_ejecutor_mapas() -> ThreadPoolExecutor:
+    """
+    Ejecutor compartido para generar mapas en segundo plano mientras el usuario llena el Paso 2.
+    Va en st.cache_resource para que no se cree un pool nuevo en cada rerun.
+    """
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        _SinAvisoContextoPrefetch()
+    )
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch_mapa")
+
+def prefetch_mapa(tipo_coordenada, lon, lat):
+    """
+    Lanza la generación del PNG del mapa en segundo plano y guarda el Future en
+    st.session_state.map_png_future. Si ya hay uno para las mismas coordenadas se
+    reutiliza, salvo que haya terminado con error (en ese caso se reintenta).
+    """
+    clave = (tipo_coordenada, lon, lat)
+    futuro = st.session_state.get('map_png_future')
+    if (
+        futuro is None
+        or st.session_state.get('map_png_key') != clave
+        or (futuro.done() and futuro.exception() is not None)
+    ):
+        ejecutor = obtener_ejecutor_mapas()
+        if tipo_coordenada == "Urbano":
+            futuro = ejecutor.submit(get_urban_map_png, lon, lat)
+        else:
+            futuro = ejecutor.submit(get_map_png_bytes, lon, lat, buffer_m=300, zoom=17)
+        st.session_state.map_png_future = futuro
+        st.session_state.map_png_key = clave
+    return futuro
+
+def obtener_mapa_png(tipo_coordenada, lon, lat):
+    """
+    Retorna el PNG (bytes) del mapa; normalmente ya está listo gracias a prefetch_mapa.
+    Lanza FutureTimeoutError si la descarga sigue en curso después de ESPERA_MAX_MAPA.
+    """
+    return prefetch_mapa(tipo_coordenada, lon, lat).result(timeout=ESPERA_MAX_MAPA)
 
 
 def convertir_a_mayusculas(data):
+    """
+    Retorna una copia de data con todas las cadenas en mayúsculas.
+    Recorre dicts, listas y tuplas anidados con una pila explícita (sin recursión);
+    construye contenedores nuevos, así que no hace falta copiar data antes.
+    Los archivos (UploadedFile, BytesIO) y cualquier otro tipo se conservan por referencia.
+    """
     if isinstance(data, str):
         return data.upper()
-    elif isinstance(data, dict):
-        return {k: convertir_a_mayusculas(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convertir_a_mayusculas(v) for v in data]
-    elif isinstance(data, tuple):
-        return tuple(convertir_a_mayusculas(v) for v in data)
-    else:
-        return data  # cualquier otro tipo se deja igual
+    if isinstance(data, io.IOBase) or not isinstance(data, (dict, list, tuple)):
+        return data
+
+    raiz = {} if isinstance(data, dict) else [None] * len(data)
+    pila = [(data, raiz)]
+    tuplas = []  # (contenedor, clave) de listas que al final vuelven a ser tuplas
+
+    while pila:
+        origen, destino = pila.pop()
+        for k, v in (origen.items() if isinstance(origen, dict) else enumerate(origen)):
+            if isinstance(v, str):
+                v = v.upper()
+            elif isinstance(v, io.IOBase):
+                pass
+            elif isinstance(v, (dict, list, tuple)):
+                hijo = {} if isinstance(v, dict) else [None] * len(v)
+                pila.append((v, hijo))
+                if isinstance(v, tuple):
+                    tuplas.append((destino, k))
+                v = hijo
+            destino[k] = v
+
+    # Las tuplas internas se crean después que las externas: convertir en orden inverso
+    for contenedor, k in reversed(tuplas):
+        contenedor[k] = tuple(contenedor[k])
+
+    return tuple(raiz) if isinstance(data, tuple) else raiz
+
+# Campos de cada objeto; su clave de widget/datos es el campo más el sufijo N{i}
+CAMPOS_OBJETO = (
+    'equipoEvaluado',
+    'marcaEquipoEvaluado',
+    'objetoEquipoEvaluado',
+    'imgTermografica',
+    'imgEspacio',
+    'tempMaxImgTermo',
+    'tempMinImgTermo',
+    'tempPromImgTermo',
+    'emisividadImgTermo',
+    'bgTemp',
+    'desvEst',
+    'deltaT',
+    'tfaseR',
+    'tfaseS',
+    'tfaseT',
+    'tempFondo',
+    'conclusiones',
+)
 
 # Inicialización de estado
 if 'step' not in st.session_state:
@@ -135,6 +443,144 @@ def prev_step():
         st.session_state.step -= 1
         st.rerun()
 
+@st.fragment
+def formulario_objeto(i):
+    """
+    Formulario del objeto #i en el Paso 2.
+    Es un fragmento: editar uno de sus campos solo vuelve a ejecutar este objeto, no los demás.
+    """
+    # Si hay un resultado de Finalizar en pantalla (informe o errores), una edición lo deja
+    # desactualizado: rerun completo para quitarlo
+    if st.session_state.get('resultado_visible'):
+        st.session_state.resultado_visible = False
+        st.rerun(scope="app")
+
+    suf = f"N{i}"
+    k = {campo: f'{campo}{suf}' for campo in CAMPOS_OBJETO}
+
+    with st.expander(f"Termografía - Objeto #{i}", expanded=True):
+        st.markdown("---")
+
+        # --- FILA 1: Datos principales ---
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.subheader(f"Equipo {suf}")
+            st.session_state.data[k['equipoEvaluado']] = st.text_input(
+                f"Equipo Evaluado {suf}", key=k['equipoEvaluado']
+            )
+        with col2:
+            st.subheader(f"Marca {suf}")
+            st.session_state.data[k['marcaEquipoEvaluado']] = st.text_input(
+                f"Marca del Equipo {suf}", key=k['marcaEquipoEvaluado']
+            )
+            if st.session_state.data[k['marcaEquipoEvaluado']] == "":
+                st.session_state.data[k['marcaEquipoEvaluado']] = 'N/A'
+        with col3:
+            st.subheader(f"Objeto {suf}")
+            st.session_state.data[k['objetoEquipoEvaluado']] = st.text_input(
+                f"Objeto Evaluado {suf}", key=k['objetoEquipoEvaluado']
+            )
+
+        # --- FILA 2: Imágenes ---
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader(f"Imagen Termográfica {suf}")
+            key_ImgTermo = k['imgTermografica']
+            st.session_state.data[key_ImgTermo] = st.file_uploader(
+                f"Seleccione la Imagen Termográfica {suf}",
+                type=['png', 'jpg', 'jpeg'],
+                key=key_ImgTermo
+            )
+            if st.session_state.data[key_ImgTermo] is None:
+                st.warning(f"Por favor, suba la Imagen Termográfica {suf} para continuar.")
+                return
+            else:
+                st.success(f"Imagen Termográfica {suf} cargada correctamente.")
+
+        with col2:
+            st.subheader(f"Imagen del Espacio {suf}")
+            key_ImgEsp = k['imgEspacio']
+            st.session_state.data[key_ImgEsp] = st.file_uploader(
+                f"Seleccione la Imagen del Espacio {suf}",
+                type=['png', 'jpg', 'jpeg'],
+                key=key_ImgEsp
+            )
+            if st.session_state.data[key_ImgEsp] is None:
+                st.warning(f"Por favor, suba la Imagen del Espacio {suf} para continuar.")
+                return
+            else:
+                st.success(f"Imagen del Espacio {suf} cargada correctamente.")
+
+        # --- FILA 3: Temperaturas principales ---
+        st.subheader(f"Análisis Termográfico {suf}")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.session_state.data[k['tempMaxImgTermo']] = st.number_input(
+                f"Temperatura Máxima {suf} [°C]", key=k['tempMaxImgTermo'], min_value=0.0, format="%.2f"
+            )
+        with col2:
+            st.session_state.data[k['tempMinImgTermo']] = st.number_input(
+                f"Temperatura Mínima {suf} [°C]", key=k['tempMinImgTermo'], min_value=0.0, format="%.2f"
+            )
+        with col3:
+            st.session_state.data[k['tempPromImgTermo']] = st.number_input(
+                f"Temperatura Promedio {suf} [°C]", key=k['tempPromImgTermo'], format="%.2f"
+            )
+        with col4:
+            st.session_state.data[k['emisividadImgTermo']] = st.number_input(
+                f"Emisividad {suf}", key=k['emisividadImgTermo'], min_value=0.0, format="%.2f"
+            )
+
+        # --- FILA 4: Otros análisis termográficos ---
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.session_state.data[k['bgTemp']] = st.number_input(
+                f"BG Temp {suf} [°C]", key=k['bgTemp'], min_value=0.0, format="%.2f"
+            )
+            if st.session_state.data[k['bgTemp']] == 0.0:
+                st.session_state.data[k['bgTemp']] = 'N/A'
+        with col2:
+            st.session_state.data[k['desvEst']] = st.number_input(
+                f"Desviación Estándar {suf}", key=k['desvEst'], min_value=0.0, format="%.2f"
+            )
+            if st.session_state.data[k['desvEst']] == 0.0:
+                st.session_state.data[k['desvEst']] = 'N/A'
+        with col3:
+            st.session_state.data[k['deltaT']] = st.number_input(
+                f"Delta T {suf}", key=k['deltaT'], min_value=0.0, format="%.2f"
+            )
+            if st.session_state.data[k['deltaT']] == 0.0:
+                st.session_state.data[k['deltaT']] = 'N/A'
+
+        # --- FILA 5: Temperaturas de fase ---
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.session_state.data[k['tfaseR']] = st.number_input(
+                f"T-FASE R {suf} [°C]", key=k['tfaseR'], format="%.2f"
+            )
+        with col2:
+            st.session_state.data[k['tfaseS']] = st.number_input(
+                f"T-FASE S {suf} [°C]", key=k['tfaseS'], format="%.2f"
+            )
+        with col3:
+            st.session_state.data[k['tfaseT']] = st.number_input(
+                f"T-FASE T {suf} [°C]", key=k['tfaseT'], format="%.2f"
+            )
+            
+
+        # --- FILA 6: Otros datos finales ---
+        col1, col2 = st.columns(2)
+        with col1:
+            st.session_state.data[k['tempFondo']] = st.number_input(
+                f"Temperatura de Fondo {suf} [°C]", key=k['tempFondo'], min_value=0.0, format="%.2f"
+            )
+        with col2:
+            st.session_state.data[k['conclusiones']] = st.text_area(
+                f"Conclusiones de la Tabla {suf}", key=k['conclusiones']
+            )
+
+        st.markdown("---")
+
 # Paso 1: Información General
 if st.session_state.step == 1:
     st.header("Paso 1: Información General")
@@ -162,17 +608,32 @@ if st.session_state.step == 1:
 # Paso 2: Datos Técnicos
 elif st.session_state.step == 2:
     st.header("Paso 2: Datos Técnicos de los Objetos")
-    
-    datos_Sin_Mayuscula = st.session_state.data.copy()
-    datos = convertir_a_mayusculas(datos_Sin_Mayuscula)
+
+    # Un rerun completo redibuja la página sin el resultado anterior de Finalizar
+    st.session_state.resultado_visible = False
     
     cantidad_objetos = int(st.session_state.data['cantidadObjetos'])
     
     template_path = obtener_template_path(cantidad_objetos)
+
+    # Adelantar la descarga del mapa mientras se llenan los datos técnicos
+    if st.session_state.data['latitud'] and st.session_state.data['longitud']:
+        try:
+            prefetch_mapa(
+                st.session_state.data['tipoCoordenada'],
+                _to_float(st.session_state.data['longitud']),
+                _to_float(st.session_state.data['latitud']),
+            )
+        except ValueError:
+            pass  # Coordenadas inválidas: el error se reporta al generar el Word
     
     try:
         
-        st.session_state.doc = DocxTemplate(template_path)
+        # Reutilizar la plantilla de la sesión mientras no cambie el archivo a usar
+        doc_key = (template_path, os.path.getmtime(template_path))
+        if st.session_state.get('doc_key') != doc_key:
+            st.session_state.doc = get_cached_template(template_path)
+            st.session_state.doc_key = doc_key
         
     except FileNotFoundError:
         
@@ -180,189 +641,97 @@ elif st.session_state.step == 2:
 
 
     for i in range(1, cantidad_objetos + 1):
-        suf = f"N{i}"
-
-        with st.expander(f"Termografía - Objeto #{i}", expanded=True):
-            st.markdown("---")
-
-            # --- FILA 1: Datos principales ---
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.subheader(f"Equipo {suf}")
-                st.session_state.data[f'equipoEvaluado{suf}'] = st.text_input(
-                    f"Equipo Evaluado {suf}", key=f'equipoEvaluado{suf}'
-                )
-            with col2:
-                st.subheader(f"Marca {suf}")
-                st.session_state.data[f'marcaEquipoEvaluado{suf}'] = st.text_input(
-                    f"Marca del Equipo {suf}", key=f'marcaEquipoEvaluado{suf}'
-                )
-                if st.session_state.data[f'marcaEquipoEvaluado{suf}'] == "":
-                    st.session_state.data[f'marcaEquipoEvaluado{suf}'] = 'N/A'
-            with col3:
-                st.subheader(f"Objeto {suf}")
-                st.session_state.data[f'objetoEquipoEvaluado{suf}'] = st.text_input(
-                    f"Objeto Evaluado {suf}", key=f'objetoEquipoEvaluado{suf}'
-                )
-
-            # --- FILA 2: Imágenes ---
-            col1, col2 = st.columns(2)
-            with col1:
-                st.subheader(f"Imagen Termográfica {suf}")
-                key_ImgTermo = f'imgTermografica{suf}'
-                st.session_state.data[key_ImgTermo] = st.file_uploader(
-                    f"Seleccione la Imagen Termográfica {suf}",
-                    type=['png', 'jpg', 'jpeg'],
-                    key=key_ImgTermo
-                )
-                if st.session_state.data[key_ImgTermo] is None:
-                    st.warning(f"Por favor, suba la Imagen Termográfica {suf} para continuar.")
-                    continue
-                else:
-                    st.success(f"Imagen Termográfica {suf} cargada correctamente.")
-
-            with col2:
-                st.subheader(f"Imagen del Espacio {suf}")
-                key_ImgEsp = f'imgEspacio{suf}'
-                st.session_state.data[key_ImgEsp] = st.file_uploader(
-                    f"Seleccione la Imagen del Espacio {suf}",
-                    type=['png', 'jpg', 'jpeg'],
-                    key=key_ImgEsp
-                )
-                if st.session_state.data[key_ImgEsp] is None:
-                    st.warning(f"Por favor, suba la Imagen del Espacio {suf} para continuar.")
-                    continue
-                else:
-                    st.success(f"Imagen del Espacio {suf} cargada correctamente.")
-
-            # --- FILA 3: Temperaturas principales ---
-            st.subheader(f"Análisis Termográfico {suf}")
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.session_state.data[f'tempMaxImgTermo{suf}'] = st.number_input(
-                    f"Temperatura Máxima {suf} [°C]", key=f'tempMaxImgTermo{suf}', min_value=0.0, format="%.2f"
-                )
-            with col2:
-                st.session_state.data[f'tempMinImgTermo{suf}'] = st.number_input(
-                    f"Temperatura Mínima {suf} [°C]", key=f'tempMinImgTermo{suf}', min_value=0.0, format="%.2f"
-                )
-            with col3:
-                st.session_state.data[f'tempPromImgTermo{suf}'] = st.number_input(
-                    f"Temperatura Promedio {suf} [°C]", key=f'tempPromImgTermo{suf}', format="%.2f"
-                )
-            with col4:
-                st.session_state.data[f'emisividadImgTermo{suf}'] = st.number_input(
-                    f"Emisividad {suf}", key=f'emisividadImgTermo{suf}', min_value=0.0, format="%.2f"
-                )
-
-            # --- FILA 4: Otros análisis termográficos ---
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.session_state.data[f'bgTemp{suf}'] = st.number_input(
-                    f"BG Temp {suf} [°C]", key=f'bgTemp{suf}', min_value=0.0, format="%.2f"
-                )
-                if st.session_state.data[f'bgTemp{suf}'] == 0.0:
-                    st.session_state.data[f'bgTemp{suf}'] = 'N/A'
-            with col2:
-                st.session_state.data[f'desvEst{suf}'] = st.number_input(
-                    f"Desviación Estándar {suf}", key=f'desvEst{suf}', min_value=0.0, format="%.2f"
-                )
-                if st.session_state.data[f'desvEst{suf}'] == 0.0:
-                    st.session_state.data[f'desvEst{suf}'] = 'N/A'
-            with col3:
-                st.session_state.data[f'deltaT{suf}'] = st.number_input(
-                    f"Delta T {suf}", key=f'deltaT{suf}', min_value=0.0, format="%.2f"
-                )
-                if st.session_state.data[f'deltaT{suf}'] == 0.0:
-                    st.session_state.data[f'deltaT{suf}'] = 'N/A'
-
-            # --- FILA 5: Temperaturas de fase ---
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.session_state.data[f'tfaseR{suf}'] = st.number_input(
-                    f"T-FASE R {suf} [°C]", key=f'tfaseR{suf}', format="%.2f"
-                )
-            with col2:
-                st.session_state.data[f'tfaseS{suf}'] = st.number_input(
-                    f"T-FASE S {suf} [°C]", key=f'tfaseS{suf}', format="%.2f"
-                )
-            with col3:
-                st.session_state.data[f'tfaseT{suf}'] = st.number_input(
-                    f"T-FASE T {suf} [°C]", key=f'tfaseT{suf}', format="%.2f"
-                )
-                
-
-            # --- FILA 6: Otros datos finales ---
-            col1, col2 = st.columns(2)
-            with col1:
-                st.session_state.data[f'tempFondo{suf}'] = st.number_input(
-                    f"Temperatura de Fondo {suf} [°C]", key=f'tempFondo{suf}', min_value=0.0, format="%.2f"
-                )
-            with col2:
-                st.session_state.data[f'conclusiones{suf}'] = st.text_area(
-                    f"Conclusiones de la Tabla {suf}", key=f'conclusiones{suf}'
-                )
-
-            st.markdown("---")
+        formulario_objeto(i)
     
     
     cols = st.columns(1)
     if cols[0].button("Finalizar Formulario y Generar Word"):
+        # Lo que se dibuje aquí (informe o errores) se quita al editar un objeto
+        st.session_state.resultado_visible = True
         
-        cantidad_objetos = int(st.session_state.data['cantidadObjetos'])
+        d = st.session_state.data
+        modulos_docx = _lazy_import_docx()
+        InlineImage = modulos_docx.InlineImage
+        cantidad_objetos = int(d['cantidadObjetos'])
         
-        datos = convertir_a_mayusculas(st.session_state.data.copy())
+        datos = convertir_a_mayusculas(d)
         
         print("Estado de la variable datos antes del procesamiento de imágenes y cálculos:")
         
         print(datos)
         
         print("******"*50)
+
+        sufijos = [f"N{i}" for i in range(1, cantidad_objetos + 1)]
+        fases_R, fases_S, fases_T, promedios = [], [], [], []
+        imagenes = []
+        imagenes_validas = True
             
-        for i in range(1, cantidad_objetos + 1):
-            suf = f"N{i}"
-                
-            key_ImgTermo = f'imgTermografica{suf}'
-            buf_ImgTermo = io.BytesIO(st.session_state.data[key_ImgTermo].read()) if st.session_state.data[key_ImgTermo] else None
-            buf_ImgTermo.seek(0)
-            datos[key_ImgTermo] = InlineImage(st.session_state.doc, buf_ImgTermo, Cm(7.5), Cm(6.5))
+        for i, suf in enumerate(sufijos, start=1):
                 
-            key_ImgEsp = f'imgEspacio{suf}'
-            buf_ImgEsp = io.BytesIO(st.session_state.data[key_ImgEsp].read()) if st.session_state.data[key_ImgEsp] else None
-            buf_ImgEsp.seek(0)
-            datos[key_ImgEsp] = InlineImage(st.session_state.doc, buf_ImgEsp, Cm(7.5), Cm(6.5))
+            # Imágenes ya preparadas (reducidas) se toman de la sesión si el archivo no cambió
+            for key_Img in (f'imgTermografica{suf}', f'imgEspacio{suf}'):
+                upl_Img = d[key_Img]
+                try:
+                    huella, datos_img = preparar_imagen(key_Img, upl_Img)
+                    imagenes.append((key_Img, huella, io.BytesIO(datos_img)))
+                except Exception as e:
+                    # Archivo vacío, dañado o que no es una imagen
+                    st.error(f"No se pudo procesar la imagen {key_Img} del Objeto #{i}. Verifique el archivo subido. {e}")
+                    imagenes_validas = False
             
-            st.session_state.data[f'tNfaseR{suf}'] = st.session_state.data.get(f'tfaseR{suf}')
-            st.session_state.data[f'tNfaseS{suf}'] = st.session_state.data.get(f'tfaseS{suf}')
-            st.session_state.data[f'tNfaseT{suf}'] = st.session_state.data.get(f'tfaseT{suf}')
-            st.session_state.data[f'tempNPromImgTermo{suf}'] = st.session_state.data.get(f'tempPromImgTermo{suf}')
+            r, s, t, prom = (d.get(k) for k in (f'tfaseR{suf}', f'tfaseS{suf}', f'tfaseT{suf}', f'tempPromImgTermo{suf}'))
+            d.update({
+                f'tNfaseR{suf}': r,
+                f'tNfaseS{suf}': s,
+                f'tNfaseT{suf}': t,
+                f'tempNPromImgTermo{suf}': prom,
+            })
+            fases_R.append(float(r))
+            fases_S.append(float(s))
+            fases_T.append(float(t))
+            promedios.append(float(prom))
                 
-            st.session_state.data[f'valNumResDeltaRs{suf}'] = float(st.session_state.data.get(f'tNfaseR{suf}')) - float(st.session_state.data.get(f'tNfaseS{suf}'))
-            st.session_state.data[f'valNumResDeltaSt{suf}'] = float(st.session_state.data.get(f'tNfaseS{suf}')) - float(st.session_state.data.get(f'tNfaseT{suf}'))
-            st.session_state.data[f'valNumResDeltaTr{suf}'] = float(st.session_state.data.get(f'tNfaseT{suf}')) - float(st.session_state.data.get(f'tNfaseR{suf}'))
-                
-            st.session_state.data[f'valNumDeltaRs{suf}'] = round(abs(st.session_state.data.get(f'valNumResDeltaRs{suf}')), 2)
-            st.session_state.data[f'valNumDeltaSt{suf}'] = round(abs(st.session_state.data.get(f'valNumResDeltaSt{suf}')), 2)
-            st.session_state.data[f'valNumDeltaTr{suf}'] = round(abs(st.session_state.data.get(f'valNumResDeltaTr{suf}')), 2)
-            
-            st.session_state.data[f'clasificacionDeltaRs{suf}'] = clasificar_delta(float(st.session_state.data.get(f'valNumDeltaRs{suf}')), float(st.session_state.data.get(f'tempNPromImgTermo{suf}')))[0]
-            st.session_state.data[f'clasificacionDeltaSt{suf}'] = clasificar_delta(float(st.session_state.data.get(f'valNumDeltaSt{suf}')), float(st.session_state.data.get(f'tempNPromImgTermo{suf}')))[0]
-            st.session_state.data[f'clasificacionDeltaTr{suf}'] = clasificar_delta(float(st.session_state.data.get(f'valNumDeltaTr{suf}')), float(st.session_state.data.get(f'tempNPromImgTermo{suf}')))[0]
-
-            st.session_state.data[f'accionDeltaRs{suf}'] = clasificar_delta(float(st.session_state.data.get(f'valNumDeltaRs{suf}')), float(st.session_state.data.get(f'tempNPromImgTermo{suf}')))[1]
-            st.session_state.data[f'accionDeltaSt{suf}'] = clasificar_delta(float(st.session_state.data.get(f'valNumDeltaSt{suf}')), float(st.session_state.data.get(f'tempNPromImgTermo{suf}')))[1]
-            st.session_state.data[f'accionDeltaTr{suf}'] = clasificar_delta(float(st.session_state.data.get(f'valNumDeltaTr{suf}')), float(st.session_state.data.get(f'tempNPromImgTermo{suf}')))[1]
-
-            st.session_state.data[f'deltaRs{suf}'] = f"{st.session_state.data.get(f'valNumDeltaRs{suf}')} °C ({st.session_state.data.get(f'clasificacionDeltaRs{suf}')} - {st.session_state.data.get(f'accionDeltaRs{suf}')})"
-            st.session_state.data[f'deltaSt{suf}'] = f"{st.session_state.data.get(f'valNumDeltaSt{suf}')} °C ({st.session_state.data.get(f'clasificacionDeltaSt{suf}')} - {st.session_state.data.get(f'accionDeltaSt{suf}')})"
-            st.session_state.data[f'deltaTr{suf}'] = f"{st.session_state.data.get(f'valNumDeltaTr{suf}')} °C ({st.session_state.data.get(f'clasificacionDeltaTr{suf}')} - {st.session_state.data.get(f'accionDeltaTr{suf}')})"
-
             print(datos)
             
             print("------"*50)
+
+        datos.update({
+            key_Img: modulos_docx.ImagenInline(
+                st.session_state.doc, buf_Img, modulos_docx.ANCHO_IMG, modulos_docx.ALTO_IMG, huella=huella
+            )
+            for key_Img, huella, buf_Img in imagenes
+        })
+
+        # Cálculo vectorizado de deltas y clasificaciones para todos los objetos
+        R, S, T = np.array(fases_R), np.array(fases_S), np.array(fases_T)
+        prom = np.array(promedios)
+
+        deltas_res = np.stack([R - S, S - T, T - R])
+        deltas = np.abs(deltas_res).round(2)
+        clasificaciones, acciones = clasificar_deltas(deltas, prom)
+
+        resultados = {
+            'valNumResDelta': deltas_res.tolist(),
+            'valNumDelta': deltas.tolist(),
+            'clasificacionDelta': clasificaciones.tolist(),
+            'accionDelta': acciones.tolist(),
+        }
+        calculados = {
+            f'{campo}{fase}{suf}': valores[j][n]
+            for campo, valores in resultados.items()
+            for j, fase in enumerate(FASES_DELTA)
+            for n, suf in enumerate(sufijos)
+        }
+        calculados.update({
+            f'delta{fase}{suf}': f"{resultados['valNumDelta'][j][n]} °C ({resultados['clasificacionDelta'][j][n]} - {resultados['accionDelta'][j][n]})"
+            for j, fase in enumerate(FASES_DELTA)
+            for n, suf in enumerate(sufijos)
+        })
+        d.update(calculados)
                 
                 
-        todos_los_datos_completos = True
+        todos_los_datos_completos = imagenes_validas
         
         # 1. Bucle de validación y cálculo (Ejecutar solo al presionar el botón)
         for i in range(1, cantidad_objetos + 1):
@@ -403,15 +772,13 @@ elif st.session_state.step == 2:
                     
                         if st.session_state.data['latitud'] and st.session_state.data['longitud']:
                             try:
-                                lat = float(str(datos['latitud']).replace(',', '.'))
-                                lon = float(str(datos['longitud']).replace(',', '.'))
-                                mapa = StaticMap(600, 400)
-                                mapa.add_marker(CircleMarker((lon, lat), 'red', 12))
-                                img_map = mapa.render()
-                                buf_map = io.BytesIO()
-                                img_map.save(buf_map, format='PNG')
+                                lat = _to_float(datos['latitud'])
+                                lon = _to_float(datos['longitud'])
+                                buf_map = io.BytesIO(obtener_mapa_png("Urbano", lon, lat))
                                 buf_map.seek(0)
-                                datos['imgMapsProyecto'] = InlineImage(st.session_state.doc, buf_map, Cm(15), Cm(10))
+                                datos['imgMapsProyecto'] = InlineImage(st.session_state.doc, buf_map, modulos_docx.ANCHO_MAPA, modulos_docx.ALTO_MAPA)
+                            except FutureTimeoutError:
+                                raise  # El mapa sigue descargándose: se avisa abajo sin generar el Word
                             except Exception as e:
                                 st.error(f"Coordenadas inválidas para el mapa. {e}")
                         else:
@@ -421,23 +788,29 @@ elif st.session_state.step == 2:
                                 
                         if st.session_state.data['latitud'] and st.session_state.data['longitud']:
                             try:
-                                lat = float(str(st.session_state.data['latitud']).replace(',', '.'))
+                                lat = _to_float(st.session_state.data['latitud'])
                                     
-                                lon = float(str(st.session_state.data['longitud']).replace(',', '.'))
+                                lon = _to_float(st.session_state.data['longitud'])
                                     
                                 st.warning(f"Prueba de coordenada en modo rural (latitud): {lat}")
                                 st.warning(f"Prueba de coordenada en modo rural (longitud): {lon}")
                                         
-                                png_bytes = get_map_png_bytes(lon, lat, buffer_m=300, zoom=17)
+                                png_bytes = obtener_mapa_png("Rural", lon, lat)
                                         
                                 buf_map = io.BytesIO(png_bytes)
                                 buf_map.seek(0)
-                                datos['imgMapsProyecto'] = InlineImage(st.session_state.doc, buf_map, Cm(15), Cm(10))
+                                datos['imgMapsProyecto'] = InlineImage(st.session_state.doc, buf_map, modulos_docx.ANCHO_MAPA, modulos_docx.ALTO_MAPA)
+                            except FutureTimeoutError:
+                                raise  # El mapa sigue descargándose: se avisa abajo sin generar el Word
                             except Exception as e:
                                 st.error(f"Coordenadas inválidas para el mapa. {e}")
                         else:
                             st.error("Faltan coordenadas para el mapa.")
                             
+                    # Pasar a docxtpl solo las claves que la plantilla usa
+                    referenciadas = obtener_variables_template(*st.session_state.doc_key)
+                    datos = {k: v for k, v in datos.items() if k in referenciadas}
+
                     print("******"*50)
                     print("Datos antes de renderizar el documento:")
                     print(datos)
@@ -445,16 +818,22 @@ elif st.session_state.step == 2:
                             
                     st.session_state.doc.render(datos)
                     output_path = f"reporteProtocoloTermografia.docx"
-                    st.session_state.doc.save(output_path)
+
+                    # Guardar en memoria: sin escribir a disco ni compartir el archivo entre sesiones
+                    buf_docx = io.BytesIO()
+                    st.session_state.doc.save(buf_docx)
                     
                     st.success(f"Documento generado exitosamente: {output_path}")
-                    with open(output_path, "rb") as file:
-                        btn = st.download_button(
-                            label="Descargar Informe Word",
-                            data=file,
-                            file_name=output_path,
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                        )
+                    btn = st.download_button(
+                        label="Descargar Informe Word",
+                        data=buf_docx.getvalue(),
+                        file_name=output_path,
+                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                    )
+                        
+                except FutureTimeoutError:
+                    
+                    st.warning("El mapa todavía se está descargando. Espere unos segundos y vuelva a presionar \"Finalizar Formulario y Generar Word\".")
                         
                 except Exception as e:
                     